@@ -0,0 +1,70 @@
+"""
+Persistent key/value cache backed by SQLite, so claim verdicts survive
+across runs of the pipeline.
+"""
+
+import logging
+import pickle
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Iterable, Optional, Tuple, Union
+
+log = logging.getLogger(__name__)
+
+# Per-user cache directory shared by all on-disk caches of the checker.
+CACHE_DIR = Path.home() / ".cache" / "consistency_checker"
+
+
+class SQLiteCache:
+    """
+    Minimal get/put store: one ``KV(key TEXT PRIMARY KEY, value BLOB)`` table
+    holding pickled values. The connection is opened once and shared across
+    threads (guarded by a lock); WAL mode lets other processes read while a
+    write is in progress.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS KV (key TEXT PRIMARY KEY, value BLOB)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for ``key``, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM KV WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        try:
+            return pickle.loads(row[0])
+        except Exception as exc:  # noqa: BLE001
+            log.warning("[CACHE][WARN] Ignoring unreadable cache entry %s: %s", key, exc)
+            return None
+
+    def put(self, key: str, value: Any) -> None:
+        """Store ``value`` under ``key``, replacing any existing entry."""
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO KV (key, value) VALUES (?, ?)", (key, sqlite3.Binary(payload))
+            )
+            self._conn.commit()
+
+    def put_many(self, items: Iterable[Tuple[str, Any]]) -> None:
+        """Store several (key, value) pairs in one transaction."""
+        rows = [
+            (key, sqlite3.Binary(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)))
+            for key, value in items
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO KV (key, value) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
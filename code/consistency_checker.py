@@ -3,29 +3,293 @@ Consistency checking for character backstories using Gemini 2.0 and the
 NovelRetriever index.
 """
 
+import asyncio
+import copy
+import functools
+import hashlib
 import json
+import logging
 import os
 import re
 import sys
-import time
-from typing import Any, Dict, List
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 import google.generativeai as genai
+import numpy as np
+
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+except ImportError:  # orjson is optional; fall back to the stdlib parser
+    _json_loads = json.loads
 
 # Ensure we can import sibling modules
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-from retriever import NovelRetriever  # noqa: E402
+from cache import CACHE_DIR, SQLiteCache  # noqa: E402
+from rate_limit import get_rate_limiter, is_rate_limit_error, retry_delay_from_error  # noqa: E402
+from retriever import NovelRetriever, NovelSource  # noqa: E402
+
+log = logging.getLogger(__name__)
 
 # Configure Gemini
 genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
 
-SAFETY_SETTINGS = [
-    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+MODEL_NAME = "gemini-2.0-flash-exp"
+
+# Read-only so concurrent checkers cannot mutate the shared settings.
+SAFETY_SETTINGS = tuple(
+    MappingProxyType(setting)
+    for setting in (
+        {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+        {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+        {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+        {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    )
+)
+
+# Configured models shared by every ConsistencyChecker, keyed by model name.
+_MODEL_CACHE: Dict[str, genai.GenerativeModel] = {}
+_MODEL_CACHE_LOCK = threading.Lock()
+
+
+def _get_model(model_name: str = MODEL_NAME) -> genai.GenerativeModel:
+    """Return the shared GenerativeModel for ``model_name``, creating it once."""
+    with _MODEL_CACHE_LOCK:
+        model = _MODEL_CACHE.get(model_name)
+        if model is None:
+            model = genai.GenerativeModel(
+                model_name=model_name,
+                generation_config={
+                    "temperature": 0.2,
+                    "response_mime_type": "application/json",
+                },
+                # The SDK only accepts plain dicts here.
+                safety_settings=[dict(setting) for setting in SAFETY_SETTINGS],
+            )
+            _MODEL_CACHE[model_name] = model
+        return model
+
+# Patterns for pulling JSON out of model responses, tried in order.
+_JSON_PATTERNS = [
+    re.compile(pattern, re.DOTALL)
+    for pattern in (
+        r'```json\s*(\{.*?\}|\[.*?\])\s*```',  # ```json {...} ```
+        r'```\s*(\{.*?\}|\[.*?\])\s*```',      # ``` {...} ```
+        r'(\{.*\})',                            # {...} anywhere
+        r'(\[.*\])',                            # [...] anywhere
+    )
+]
+
+# Candidate starts of a JSON value, located by the C regex engine.
+_BRACKET_RE = re.compile(r'[{\[]')
+
+# Runs of non-word characters, collapsed when normalizing claims for de-duplication.
+_NON_WORD_RE = re.compile(r"\W+")
+
+# Prompt templates. Only the {placeholders} are filled per call; literal JSON
+# braces are doubled for str.format.
+_CLAIM_EXTRACT_TMPL = """
+You are extracting atomic claims.
+Character: {character}
+Book: {book}
+Backstory:
+\"\"\"{backstory}\"\"\"
+
+Task:
+- Extract 5-7 atomic, verifiable claims about this character.
+- Focus on traits, past events, relationships, skills, fears, and motivations.
+- Each claim should be concise and checkable against the novel text.
+
+Example format (JSON array of strings):
+[
+  "He trained as a medic during the uprising.",
+  "She distrusts the royal court due to past betrayal."
+]
+"""
+
+_CLAIM_CHECK_TMPL = """
+You are verifying backstory consistency.
+
+Character: {character}
+Book: {book}
+Claim to verify: "{claim}"
+
+Retrieved passages:
+{passages}
+
+Instructions:
+- Check for DIRECT CONTRADICTIONS (explicit conflicts).
+- Check CAUSAL CONSISTENCY (does this past make future events plausible?).
+- Check BEHAVIORAL PATTERNS (does backstory explain actions?).
+- Decide if the character could have this backstory given the text.
+
+Examples of CONSISTENT:
+- Claim: "She was a skilled navigator." Passages show her guiding ships successfully.
+- Claim: "He vowed to protect his sister." Passages show him guarding her in danger.
+
+Examples of INCONSISTENT:
+- Claim: "He loves the monarchy." Passages show he led a revolt against the king.
+- Claim: "She never left her village." Passages show her traveling abroad for years.
+
+Return JSON with:
+{{
+  "consistency": "consistent" or "contradict",
+  "confidence": float between 0.0 and 1.0,
+  "reasoning": "detailed explanation",
+  "key_evidence": "most relevant passage"
+}}
+"""
+
+_BATCH_CHECK_TMPL = """
+You are verifying backstory consistency for several claims at once.
+
+Character: {character}
+Book: {book}
+
+{claims_blob}
+
+Instructions (apply to EACH claim independently, using its own passages):
+- Check for DIRECT CONTRADICTIONS (explicit conflicts).
+- Check CAUSAL CONSISTENCY (does this past make future events plausible?).
+- Check BEHAVIORAL PATTERNS (does backstory explain actions?).
+- Decide if the character could have this backstory given the text.
+
+Examples of CONSISTENT:
+- Claim: "She was a skilled navigator." Passages show her guiding ships successfully.
+- Claim: "He vowed to protect his sister." Passages show him guarding her in danger.
+
+Examples of INCONSISTENT:
+- Claim: "He loves the monarchy." Passages show he led a revolt against the king.
+- Claim: "She never left her village." Passages show her traveling abroad for years.
+
+Return a JSON array with exactly {num_claims} objects, one per claim:
+[
+  {{
+    "claim_index": integer index of the claim,
+    "consistency": "consistent" or "contradict",
+    "confidence": float between 0.0 and 1.0,
+    "reasoning": "detailed explanation",
+    "key_evidence": "most relevant passage"
+  }}
 ]
+"""
+
+# Response schemas for Gemini JSON mode, one per prompt shape.
+_CLAIMS_SCHEMA = {"type": "array", "items": {"type": "string"}}
+
+_VERDICT_PROPERTIES = {
+    "consistency": {"type": "string", "format": "enum", "enum": ["consistent", "contradict"]},
+    "confidence": {"type": "number"},
+    "reasoning": {"type": "string"},
+    "key_evidence": {"type": "string"},
+}
+
+_VERDICT_SCHEMA = {
+    "type": "object",
+    "properties": _VERDICT_PROPERTIES,
+    "required": ["consistency", "confidence", "reasoning"],
+}
+
+_VERDICT_LIST_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {"claim_index": {"type": "integer"}, **_VERDICT_PROPERTIES},
+        "required": ["claim_index", "consistency", "confidence", "reasoning"],
+    },
+}
+
+
+def _rest_schema(schema: Any) -> Any:
+    """
+    Convert a schema to the REST form used in Batch API request files, where
+    ``type`` values are upper-case enum names (the SDK does this for us on
+    direct calls).
+    """
+    if isinstance(schema, dict):
+        return {
+            key: value.upper() if key == "type" else _rest_schema(value)
+            for key, value in schema.items()
+        }
+    if isinstance(schema, list):
+        return [_rest_schema(item) for item in schema]
+    return schema
+
+# Upper bound on concurrent Gemini requests per checker (keeps us under RPM quotas).
+MAX_CONCURRENT_REQUESTS = 8
+
+# Decision rule: this many contradictions above the confidence threshold => "contradict".
+CONTRADICTION_CONFIDENCE = 0.65
+MIN_CONTRADICTIONS = 2
+
+# Maximum number of (character, claim, top_k) retrievals memoized per checker.
+PASSAGE_CACHE_SIZE = 1024
+
+# Prompt budget: passages are truncated, then the lowest-ranked ones are dropped
+# (keeping at least MIN_PROMPT_PASSAGES per claim) until the prompt fits.
+MAX_PROMPT_CHARS = 12000
+MAX_PASSAGE_CHARS = 1200
+MIN_PROMPT_PASSAGES = 3
+
+# Semantic verdict cache: capacity per book and cosine similarity needed for a hit.
+CLAIM_CACHE_SIZE = 256
+CLAIM_CACHE_THRESHOLD = 0.92
+
+
+class _SemanticClaimCache:
+    """
+    LRU cache of claim verdicts keyed on the claim's query embedding.
+
+    A lookup hits when a stored embedding has cosine similarity >= threshold,
+    so reworded claims ("trained as a medic" / "was a medic") share a verdict.
+    """
+
+    def __init__(self, capacity: int = CLAIM_CACHE_SIZE, threshold: float = CLAIM_CACHE_THRESHOLD):
+        self.capacity = capacity
+        self.threshold = threshold
+        self._keys: List[np.ndarray] = []
+        self._values: List[Dict[str, Any]] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding: Any) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def lookup(self, embedding: Any) -> Optional[Dict[str, Any]]:
+        vec = self._normalize(embedding)
+        with self._lock:
+            if not self._keys:
+                return None
+            if self._matrix is None:
+                self._matrix = np.vstack(self._keys)
+            sims = self._matrix @ vec
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                return None
+            # Move the hit to the most-recently-used end.
+            self._keys.append(self._keys.pop(best))
+            self._values.append(self._values.pop(best))
+            self._matrix = None
+            return copy.deepcopy(self._values[-1])
+
+    def insert(self, embedding: Any, verdict: Dict[str, Any]) -> None:
+        vec = self._normalize(embedding)
+        with self._lock:
+            self._keys.append(vec)
+            self._values.append(copy.deepcopy(verdict))
+            if len(self._keys) > self.capacity:
+                self._keys.pop(0)
+                self._values.pop(0)
+            self._matrix = None
 
 
 class ConsistencyChecker:
@@ -33,9 +297,32 @@ class ConsistencyChecker:
     Verifies whether a character backstory is consistent with novel text.
     """
 
-    def __init__(self, novel_text: str, backstory_content: str, book_name: str, character_name: str):
-        if not novel_text or not novel_text.strip():
-            raise ValueError("novel_text is empty.")
+    # Shared across instances so near-duplicate claims from other backstories hit.
+    _claim_caches: Dict[str, _SemanticClaimCache] = {}
+    _claim_caches_lock = threading.Lock()
+
+    # Persistent verdict store, opened on first use and shared by all instances.
+    _verdict_store: Optional[SQLiteCache] = None
+    _verdict_store_lock = threading.Lock()
+
+    def __init__(
+        self,
+        novel_text: Optional[NovelSource],
+        backstory_content: str,
+        book_name: str,
+        character_name: str,
+        retriever: Optional[NovelRetriever] = None,
+    ):
+        """
+        Pass a prebuilt ``retriever`` to share one index across checkers for
+        the same book; ``novel_text`` is then not needed.
+        """
+        if retriever is None:
+            if novel_text is None:
+                raise ValueError("Either novel_text or retriever is required.")
+            # Paths and mmaps are validated by NovelRetriever when it chunks them.
+            if isinstance(novel_text, (str, bytes)) and not novel_text.strip():
+                raise ValueError("novel_text is empty.")
         if not backstory_content or not backstory_content.strip():
             raise ValueError("backstory_content is empty.")
         if not book_name or not book_name.strip():
@@ -47,34 +334,68 @@ class ConsistencyChecker:
         self.character_name = character_name.strip()
         self.backstory_content = backstory_content.strip()
 
-        print(f"[INIT] Building retriever for book '{self.book_name}'...")
-        self.retriever = NovelRetriever(novel_text, self.book_name)
-
-        self.model = genai.GenerativeModel(
-            model_name="gemini-2.0-flash-exp",
-            generation_config={
-                "temperature": 0.2,
-            },
-            safety_settings=SAFETY_SETTINGS,
+        if retriever is None:
+            log.info("[INIT] Building retriever for book '%s'...", self.book_name)
+            retriever = NovelRetriever(novel_text, self.book_name)
+        self.retriever = retriever
+        self._passage_cache: "OrderedDict[Tuple[str, str, int], List[Tuple[str, float, dict]]]" = OrderedDict()
+        self._claim_embeddings: Dict[str, List[float]] = {}
+        with self._claim_caches_lock:
+            self._claim_cache = self._claim_caches.setdefault(self.book_name, _SemanticClaimCache())
+
+        self.model = _get_model()
+        # Verification state between prepare_batch_request and complete_batch_request.
+        self._batch_state: Optional[Tuple[List[str], List[int], Dict[str, Any]]] = None
+
+    @classmethod
+    def from_path(
+        cls,
+        path: Union[str, os.PathLike],
+        backstory_content: str,
+        character_name: str,
+        book_name: Optional[str] = None,
+    ) -> "ConsistencyChecker":
+        """
+        Build a checker for the novel at ``path`` without reading it into a
+        string; the retriever memory-maps the file. ``book_name`` defaults to
+        the file stem.
+        """
+        path = Path(path)
+        return cls(
+            novel_text=path,
+            backstory_content=backstory_content,
+            book_name=book_name or path.stem,
+            character_name=character_name,
         )
 
     # ------------------------------------------------------------------ #
     # Internal helpers
     # ------------------------------------------------------------------ #
-    def _call_model_with_retry(self, prompt: str, max_retries: int = 4) -> str:
+    async def _call_model_with_retry(
+        self, prompt: str, schema: Optional[Dict[str, Any]] = None, max_retries: int = 4
+    ) -> str:
+        # Per-call config is merged over the model's, so only the schema varies.
+        generation_config = {"response_schema": schema} if schema else None
+        limiter = get_rate_limiter(MODEL_NAME)
         delay = 1.0
         for attempt in range(1, max_retries + 1):
             try:
-                response = self.model.generate_content(
-                    prompt,
-                    safety_settings=SAFETY_SETTINGS,
-                )
+                async with limiter.slot():
+                    # Safety settings are bound to the model; no need to resend them.
+                    response = await self.model.generate_content_async(
+                        prompt,
+                        generation_config=generation_config,
+                    )
                 return response.text
             except Exception as exc:  # noqa: BLE001
-                print(f"[RETRY] Model call failed (attempt {attempt}/{max_retries}): {exc}")
+                log.warning("[RETRY] Model call failed (attempt %d/%d): %s", attempt, max_retries, exc)
                 if attempt == max_retries:
                     raise
-                time.sleep(delay)
+                if is_rate_limit_error(exc):
+                    # The limiter holds every caller back until the shared deadline.
+                    limiter.backoff(attempt, retry_delay_from_error(exc))
+                    continue
+                await asyncio.sleep(delay)
                 delay *= 2
 
     @staticmethod
@@ -82,6 +403,10 @@ class ConsistencyChecker:
         """
         Extract and parse JSON from text response, handling markdown code blocks
         and extra text around the JSON.
+
+        The model runs in JSON mode, so the direct parse is the normal path;
+        the extraction fallbacks only run when it fails. orjson.JSONDecodeError
+        subclasses json.JSONDecodeError, so one except clause covers both parsers.
         """
         if not payload or not payload.strip():
             raise ValueError("Empty payload provided for JSON parsing.")
@@ -90,57 +415,26 @@ class ConsistencyChecker:
         
         # Try direct parsing first
         try:
-            return json.loads(text)
+            return _json_loads(text)
         except json.JSONDecodeError:
             pass
         
         # Try to extract JSON from markdown code blocks (```json ... ```)
-        json_patterns = [
-            r'```json\s*(\{.*?\}|\[.*?\])\s*```',  # ```json {...} ```
-            r'```\s*(\{.*?\}|\[.*?\])\s*```',      # ``` {...} ```
-            r'(\{.*\})',                            # {...} anywhere
-            r'(\[.*\])',                            # [...] anywhere
-        ]
-        
-        for pattern in json_patterns:
-            matches = re.findall(pattern, text, re.DOTALL)
-            for match in matches:
+        for pattern in _JSON_PATTERNS:
+            for match in pattern.findall(text):
                 try:
-                    return json.loads(match.strip())
+                    return _json_loads(match.strip())
                 except json.JSONDecodeError:
                     continue
         
-        # Try to find JSON object/array boundaries manually
-        # Look for first { or [ and last } or ]
-        start_idx = -1
-        end_idx = -1
-        
-        for i, char in enumerate(text):
-            if char in '{[':
-                start_idx = i
-                break
-        
-        if start_idx >= 0:
-            # Find matching closing bracket
-            open_char = text[start_idx]
-            close_char = '}' if open_char == '{' else ']'
-            depth = 0
-            
-            for i in range(start_idx, len(text)):
-                if text[i] == open_char:
-                    depth += 1
-                elif text[i] == close_char:
-                    depth -= 1
-                    if depth == 0:
-                        end_idx = i + 1
-                        break
-            
-            if end_idx > start_idx:
-                json_str = text[start_idx:end_idx]
-                try:
-                    return json.loads(json_str)
-                except json.JSONDecodeError:
-                    pass
+        # Let the C decoder find the boundary: try each { or [ as a start and
+        # accept the first one that decodes (trailing prose is ignored).
+        decoder = json.JSONDecoder()
+        for match in _BRACKET_RE.finditer(text):
+            try:
+                return decoder.raw_decode(text, match.start())[0]
+            except json.JSONDecodeError:
+                continue
         
         # If all else fails, raise with helpful error
         raise ValueError(
@@ -151,88 +445,134 @@ class ConsistencyChecker:
     # ------------------------------------------------------------------ #
     # Public API
     # ------------------------------------------------------------------ #
-    def extract_backstory_claims(self) -> List[str]:
+    async def extract_backstory_claims(self) -> List[str]:
         """
         Extract atomic, verifiable claims from a backstory.
         """
-        prompt = f"""
-You are extracting atomic claims.
-Character: {self.character_name}
-Book: {self.book_name}
-Backstory:
-\"\"\"{self.backstory_content}\"\"\"
-
-Task:
-- Extract 5-7 atomic, verifiable claims about this character.
-- Focus on traits, past events, relationships, skills, fears, and motivations.
-- Each claim should be concise and checkable against the novel text.
-
-Example format (JSON array of strings):
-[
-  "He trained as a medic during the uprising.",
-  "She distrusts the royal court due to past betrayal."
-]
-"""
-        raw = self._call_model_with_retry(prompt)
+        prompt = _CLAIM_EXTRACT_TMPL.format(
+            character=self.character_name,
+            book=self.book_name,
+            backstory=self.backstory_content,
+        )
+        raw = await self._call_model_with_retry(prompt, schema=_CLAIMS_SCHEMA)
         parsed = self._safe_json_loads(raw)
         if not isinstance(parsed, list):
             raise ValueError("Expected a JSON list of claims.")
         claims = [c for c in parsed if isinstance(c, str) and c.strip()]
-        print(f"[CLAIMS] Extracted {len(claims)} claim(s).")
+        log.debug("[CLAIMS] Extracted %d claim(s).", len(claims))
         return claims
 
-    def check_claim_consistency(self, claim: str) -> Dict[str, Any]:
-        """
-        Check if a claim is consistent with the novel text.
+    @classmethod
+    def _get_verdict_store(cls) -> SQLiteCache:
+        with cls._verdict_store_lock:
+            if cls._verdict_store is None:
+                cls._verdict_store = SQLiteCache(CACHE_DIR / "verdicts.sqlite")
+            return cls._verdict_store
+
+    def _verdict_key(self, claim: str) -> str:
+        return hashlib.sha256(f"{self.book_name}|{self.character_name}|{claim}".encode("utf-8")).hexdigest()
+
+    def _stored_verdict(self, claim: str) -> Optional[Dict[str, Any]]:
+        """Return the verdict persisted by a previous run for this exact claim."""
+        entry = self._get_verdict_store().get(self._verdict_key(claim))
+        if not entry:
+            return None
+        log.debug("[CACHE] Using stored verdict for claim: %s", claim)
+        verdict = dict(entry["verdict"])
+        verdict["claim"] = claim
+        return verdict
+
+    def _store_verdict(self, claim: str, passages: List[Tuple[str, float, dict]], verdict: Dict[str, Any]) -> None:
+        self._get_verdict_store().put(self._verdict_key(claim), {"passages": passages, "verdict": verdict})
+
+    async def _embed_claim(self, claim: str) -> List[float]:
+        """Embed the retrieval query for a claim, once per claim per checker."""
+        embedding = self._claim_embeddings.get(claim)
+        if embedding is None:
+            loop = asyncio.get_running_loop()
+            embedding = await loop.run_in_executor(
+                None, self.retriever.embed_query, f"{self.character_name}: {claim}"
+            )
+            self._claim_embeddings[claim] = embedding
+        return embedding
+
+    def _cached_verdict(self, claim: str, embedding: List[float]) -> Optional[Dict[str, Any]]:
+        """Return a verdict for a semantically equivalent claim, if one is cached."""
+        verdict = self._claim_cache.lookup(embedding)
+        if verdict is not None:
+            log.debug("[CACHE] Reusing verdict for near-duplicate claim: %s", claim)
+            verdict["claim"] = claim
+        return verdict
+
+    async def _retrieve_passages(self, claim: str, top_k: int = 7) -> List[Tuple[str, float, dict]]:
         """
-        if not claim or not claim.strip():
-            raise ValueError("Claim is empty.")
+        Retrieve passages for a claim without blocking the event loop.
 
-        passages = self.retriever.retrieve_relevant_passages(
-            query=f"{self.character_name}: {claim}", top_k=7
+        Results are memoized in an LRU keyed on (character, claim, top_k), so the
+        per-claim fallback and repeated claims skip the embedding + index query.
+        """
+        key = (self.character_name, claim, top_k)
+        cached = self._passage_cache.get(key)
+        if cached is not None:
+            self._passage_cache.move_to_end(key)
+            return cached
+
+        embedding = await self._embed_claim(claim)
+        # Retrieval queries Chroma synchronously; run it in the default executor.
+        loop = asyncio.get_running_loop()
+        passages = await loop.run_in_executor(
+            None,
+            functools.partial(
+                self.retriever.retrieve_relevant_passages,
+                query=f"{self.character_name}: {claim}",
+                top_k=top_k,
+                query_embedding=embedding,
+            ),
         )
+        self._passage_cache[key] = passages
+        if len(self._passage_cache) > PASSAGE_CACHE_SIZE:
+            self._passage_cache.popitem(last=False)
+        return passages
+
+    @staticmethod
+    def _passage_lines(passages: List[Tuple[str, float, dict]]) -> List[str]:
+        """Format passages (best first) for a prompt, truncating each to MAX_PASSAGE_CHARS."""
         formatted_passages = []
         for idx, (text, score, meta) in enumerate(passages, start=1):
             formatted_passages.append(
-                f"[{idx}] (score={score:.4f}, pos={meta.get('position')}) {text}"
+                f"[{idx}] (score={score:.4f}, pos={meta.get('position')}) {text[:MAX_PASSAGE_CHARS]}"
             )
-        passages_blob = "\n".join(formatted_passages) if formatted_passages else "No passages found."
-
-        prompt = f"""
-You are verifying backstory consistency.
-
-Character: {self.character_name}
-Book: {self.book_name}
-Claim to verify: "{claim}"
-
-Retrieved passages:
-{passages_blob}
+        return formatted_passages
 
-Instructions:
-- Check for DIRECT CONTRADICTIONS (explicit conflicts).
-- Check CAUSAL CONSISTENCY (does this past make future events plausible?).
-- Check BEHAVIORAL PATTERNS (does backstory explain actions?).
-- Decide if the character could have this backstory given the text.
-
-Examples of CONSISTENT:
-- Claim: "She was a skilled navigator." Passages show her guiding ships successfully.
-- Claim: "He vowed to protect his sister." Passages show him guarding her in danger.
+    @staticmethod
+    def _join_passages(lines: List[str]) -> str:
+        return "\n".join(lines) if lines else "No passages found."
 
-Examples of INCONSISTENT:
-- Claim: "He loves the monarchy." Passages show he led a revolt against the king.
-- Claim: "She never left her village." Passages show her traveling abroad for years.
+    @staticmethod
+    def _fit_prompt(
+        build: Callable[[List[List[str]]], str], passage_lines: List[List[str]], budget: int
+    ) -> str:
+        """
+        Build a prompt, dropping the lowest-ranked passage of the claim with the
+        most passages until it is under ``budget`` characters or every claim is
+        down to MIN_PROMPT_PASSAGES.
+        """
+        prompt = build(passage_lines)
+        dropped = 0
+        while len(prompt) > budget:
+            largest = max(range(len(passage_lines)), key=lambda i: (len(passage_lines[i]), i))
+            if len(passage_lines[largest]) <= MIN_PROMPT_PASSAGES:
+                break
+            passage_lines[largest].pop()
+            dropped += 1
+            prompt = build(passage_lines)
+        if dropped:
+            log.debug("[BUDGET] Dropped %d low-ranked passage(s) to fit the prompt budget.", dropped)
+        return prompt
 
-Return JSON with:
-{{
-  "consistency": "consistent" or "contradict",
-  "confidence": float between 0.0 and 1.0,
-  "reasoning": "detailed explanation",
-  "key_evidence": "most relevant passage"
-}}
-"""
-        raw = self._call_model_with_retry(prompt)
-        parsed = self._safe_json_loads(raw)
-        # Basic validation
+    @staticmethod
+    def _validate_verdict(parsed: Any, passages: List[Tuple[str, float, dict]]) -> Dict[str, Any]:
+        """Check a parsed verdict object and fill in optional fields."""
         if not isinstance(parsed, dict):
             raise ValueError("Expected JSON object for consistency result.")
         consistency = parsed.get("consistency")
@@ -244,36 +584,367 @@ Return JSON with:
         parsed.setdefault("reasoning", "")
         return parsed
 
-    def make_final_decision(self) -> Dict[str, Any]:
+    async def check_claim_consistency(self, claim: str) -> Dict[str, Any]:
         """
-        Run full pipeline: extract claims, check consistency, and decide label.
+        Check if a claim is consistent with the novel text.
         """
-        print(f"Analyzing backstory for {self.character_name}...")
-        claims = self.extract_backstory_claims()
-        print(f"Found {len(claims)} claims to verify.")
+        if not claim or not claim.strip():
+            raise ValueError("Claim is empty.")
 
-        results = []
-        for idx, claim in enumerate(claims, start=1):
-            print(f"[CHECK] ({idx}/{len(claims)}) {claim}")
+        stored = self._stored_verdict(claim)
+        if stored is not None:
+            return stored
+
+        embedding = await self._embed_claim(claim)
+        cached = self._cached_verdict(claim, embedding)
+        if cached is not None:
+            return cached
+
+        passages = await self._retrieve_passages(claim)
+
+        def build(lines: List[List[str]]) -> str:
+            return _CLAIM_CHECK_TMPL.format(
+                character=self.character_name,
+                book=self.book_name,
+                claim=claim,
+                passages=self._join_passages(lines[0]),
+            )
+
+        prompt = self._fit_prompt(build, [self._passage_lines(passages)], MAX_PROMPT_CHARS)
+        raw = await self._call_model_with_retry(prompt, schema=_VERDICT_SCHEMA)
+        parsed = self._safe_json_loads(raw)
+        verdict = self._validate_verdict(parsed, passages)
+        self._claim_cache.insert(embedding, verdict)
+        self._store_verdict(claim, passages, verdict)
+        return verdict
+
+    async def check_all_claims(self, claims: List[str]) -> List[Dict[str, Any]]:
+        """
+        Verify all claims with a single Gemini request.
+
+        Passages are retrieved per claim, then every claim and its evidence go
+        into one prompt that returns a JSON array of verdicts. Claims with a
+        semantically cached verdict are answered without the model. Falls back
+        to per-claim checks if the batched response does not validate.
+        """
+        if not claims:
+            return []
+
+        plan = await self._plan_verification(claims)
+        raw: Optional[str] = None
+        if plan["prompt"] is not None:
+            log.debug("[CHECK] Verifying %d claim(s) in a single request...", len(plan["pending"]))
             try:
-                res = self.check_claim_consistency(claim)
-                res["claim"] = claim
+                raw = await self._call_model_with_retry(plan["prompt"], schema=_VERDICT_LIST_SCHEMA)
             except Exception as exc:  # noqa: BLE001
-                print(f"[WARN] Failed to check claim: {exc}")
-                res = {
-                    "claim": claim,
-                    "consistency": "contradict",
-                    "confidence": 0.0,
-                    "reasoning": f"Error during check: {exc}",
-                    "key_evidence": "",
-                }
-            results.append(res)
-
-        high_conf_contradictions = [
-            r for r in results if r.get("consistency") == "contradict" and r.get("confidence", 0) > 0.65
+                log.warning("[WARN] Batched verification failed (%s).", exc)
+        return await self._finish_verification(plan, raw)
+
+    async def _plan_verification(self, claims: List[str]) -> Dict[str, Any]:
+        """
+        Resolve what the caches can answer and build the batched prompt for the rest.
+
+        Returns the verification state consumed by :meth:`_finish_verification`:
+        ``results`` (None where still unknown), ``pending`` indices, their
+        ``passages`` and claim ``embeddings``, and the ``prompt`` to send (None
+        when no batched request is needed).
+        """
+        results: List[Optional[Dict[str, Any]]] = [self._stored_verdict(claim) for claim in claims]
+        missing = [idx for idx, res in enumerate(results) if res is None]
+
+        # Embedding failures just skip the semantic cache; the claim is still verified.
+        embedded = await asyncio.gather(
+            *(self._embed_claim(claims[idx]) for idx in missing), return_exceptions=True
+        )
+        embeddings = {
+            idx: embedding
+            for idx, embedding in zip(missing, embedded)
+            if not isinstance(embedding, BaseException)
+        }
+        for idx, embedding in embeddings.items():
+            results[idx] = self._cached_verdict(claims[idx], embedding)
+
+        plan: Dict[str, Any] = {
+            "claims": claims,
+            "results": results,
+            "embeddings": embeddings,
+            "pending": [idx for idx, res in enumerate(results) if res is None],
+            "passages": None,
+            "prompt": None,
+        }
+        if not plan["pending"]:
+            return plan
+        cached_contradictions = sum(
+            1 for res in results if res is not None and self._is_high_conf_contradiction(res)
+        )
+        if cached_contradictions >= MIN_CONTRADICTIONS:
+            log.debug("[CHECK] Cached verdicts decide the label; skipping %d claim(s).", len(plan["pending"]))
+            for idx in plan["pending"]:
+                results[idx] = self._skipped_result(claims[idx])
+            plan["pending"] = []
+            return plan
+
+        pending_claims = [claims[idx] for idx in plan["pending"]]
+        try:
+            plan["passages"] = await asyncio.gather(
+                *(self._retrieve_passages(claim) for claim in pending_claims)
+            )
+        except Exception as exc:  # noqa: BLE001
+            log.warning("[WARN] Passage retrieval failed (%s).", exc)
+            return plan
+        plan["prompt"] = self._build_batch_prompt(pending_claims, plan["passages"])
+        return plan
+
+    async def _finish_verification(self, plan: Dict[str, Any], raw: Optional[str]) -> List[Dict[str, Any]]:
+        """
+        Complete a plan from the batched response ``raw`` (None if the request
+        was not sent or failed), checking claims individually as a fallback.
+        """
+        claims, results, pending = plan["claims"], plan["results"], plan["pending"]
+        if not pending:
+            return [r for r in results if r is not None]
+        pending_claims = [claims[idx] for idx in pending]
+
+        verdicts: Optional[List[Dict[str, Any]]] = None
+        if raw is not None and plan["passages"] is not None:
+            verdicts = self._parse_batch_verdicts(raw, pending_claims, plan["passages"])
+
+        if verdicts is None:
+            log.warning("[WARN] Checking claims individually.")
+            verdicts = await self._check_claims_individually(pending_claims)
+        else:
+            for idx, passages, verdict in zip(pending, plan["passages"], verdicts):
+                if idx in plan["embeddings"]:
+                    self._claim_cache.insert(plan["embeddings"][idx], verdict)
+                self._store_verdict(claims[idx], passages, verdict)
+
+        for idx, verdict in zip(pending, verdicts):
+            results[idx] = verdict
+        return [r for r in results if r is not None]
+
+    def _build_batch_prompt(
+        self, claims: List[str], passages_per_claim: List[List[Tuple[str, float, dict]]]
+    ) -> str:
+        """Build one prompt verifying every claim against its passages."""
+        def build(lines: List[List[str]]) -> str:
+            claims_blob = "\n\n".join(
+                f"### Claim {idx}: \"{claim}\"\n"
+                f"Retrieved passages:\n{self._join_passages(claim_lines)}"
+                for idx, (claim, claim_lines) in enumerate(zip(claims, lines))
+            )
+            return _BATCH_CHECK_TMPL.format(
+                character=self.character_name,
+                book=self.book_name,
+                claims_blob=claims_blob,
+                num_claims=len(claims),
+            )
+
+        # Each claim gets the same budget it would have in its own prompt.
+        return self._fit_prompt(
+            build,
+            [self._passage_lines(passages) for passages in passages_per_claim],
+            MAX_PROMPT_CHARS * len(claims),
+        )
+
+    def _parse_batch_verdicts(
+        self, raw: str, claims: List[str], passages_per_claim: List[List[Tuple[str, float, dict]]]
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Validate a batched response; return None if it does not validate."""
+        try:
+            parsed = self._safe_json_loads(raw)
+            if not isinstance(parsed, list) or len(parsed) != len(claims):
+                raise ValueError(
+                    f"Expected a JSON list of {len(claims)} verdicts, "
+                    f"got {len(parsed) if isinstance(parsed, list) else type(parsed).__name__}."
+                )
+            verdicts: List[Optional[Dict[str, Any]]] = [None] * len(claims)
+            for position, item in enumerate(parsed):
+                idx = item.get("claim_index", position) if isinstance(item, dict) else position
+                if not isinstance(idx, int) or not 0 <= idx < len(claims) or verdicts[idx] is not None:
+                    raise ValueError(f"Invalid or duplicate claim_index: {idx!r}")
+                verdict = self._validate_verdict(item, passages_per_claim[idx])
+                verdict.pop("claim_index", None)
+                verdict["claim"] = claims[idx]
+                verdicts[idx] = verdict
+        except Exception as exc:  # noqa: BLE001
+            log.warning("[WARN] Batched verification failed (%s).", exc)
+            return None
+        return [v for v in verdicts if v is not None]
+
+    @staticmethod
+    def _is_high_conf_contradiction(result: Dict[str, Any]) -> bool:
+        return (
+            result.get("consistency") == "contradict"
+            and result.get("confidence", 0) > CONTRADICTION_CONFIDENCE
+        )
+
+    @staticmethod
+    def _skipped_result(claim: str) -> Dict[str, Any]:
+        return {
+            "claim": claim,
+            "consistency": "skipped",
+            "confidence": 0.0,
+            "reasoning": "Not checked: enough high-confidence contradictions were already found.",
+            "key_evidence": "",
+        }
+
+    async def _check_claims_individually(self, claims: List[str]) -> List[Dict[str, Any]]:
+        """
+        Verify claims one request each, concurrently and bounded by the semaphore.
+
+        Stops once MIN_CONTRADICTIONS high-confidence contradictions are found:
+        in-flight checks are cancelled and the remaining claims are marked
+        "skipped", since the final label can no longer change.
+        """
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+        async def _bounded_check(idx: int, claim: str) -> Dict[str, Any]:
+            async with semaphore:
+                log.debug("[CHECK] (%d/%d) %s", idx, len(claims), claim)
+                return await self.check_claim_consistency(claim)
+
+        tasks = {
+            asyncio.ensure_future(_bounded_check(idx + 1, claim)): idx
+            for idx, claim in enumerate(claims)
+        }
+        results: List[Optional[Dict[str, Any]]] = [None] * len(claims)
+        high_conf_contradictions = 0
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                idx = tasks[task]
+                claim = claims[idx]
+                try:
+                    res = task.result()
+                    res["claim"] = claim
+                except Exception as exc:  # noqa: BLE001
+                    log.warning("[WARN] Failed to check claim: %s", exc)
+                    res = {
+                        "claim": claim,
+                        "consistency": "contradict",
+                        "confidence": 0.0,
+                        "reasoning": f"Error during check: {exc}",
+                        "key_evidence": "",
+                    }
+                results[idx] = res
+                if self._is_high_conf_contradiction(res):
+                    high_conf_contradictions += 1
+
+            if high_conf_contradictions >= MIN_CONTRADICTIONS and pending:
+                log.debug("[CHECK] Decision reached; skipping %d remaining claim(s).", len(pending))
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                break
+
+        return [
+            res if res is not None else self._skipped_result(claim)
+            for claim, res in zip(claims, results)
         ]
-        final_label = "contradict" if len(high_conf_contradictions) >= 2 else "consistent"
-        rationale = self.generate_rationale(results, final_label)
+
+    @staticmethod
+    def _dedupe_claims(claims: List[str]) -> Tuple[List[str], List[int]]:
+        """
+        Collapse claims that are equal after lowercasing and stripping punctuation.
+
+        Returns the unique claims (first occurrence wins) and, for each input
+        claim, the index of its representative in that list.
+        """
+        seen: Dict[str, int] = {}
+        unique: List[str] = []
+        slots: List[int] = []
+        for claim in claims:
+            key = _NON_WORD_RE.sub(" ", claim.lower()).strip()
+            if key not in seen:
+                seen[key] = len(unique)
+                unique.append(claim)
+            slots.append(seen[key])
+        return unique, slots
+
+    def make_final_decision(self) -> Dict[str, Any]:
+        """
+        Run full pipeline: extract claims, check consistency, and decide label.
+
+        Synchronous wrapper around :meth:`make_final_decision_async`.
+        """
+        return asyncio.run(self.make_final_decision_async())
+
+    async def make_final_decision_async(self) -> Dict[str, Any]:
+        """
+        Async pipeline: one request extracts claims, one request verifies them all.
+        """
+        log.debug("Analyzing backstory for %s...", self.character_name)
+        claims = await self.extract_backstory_claims()
+        log.debug("Found %d claims to verify.", len(claims))
+
+        unique_claims, slots = self._dedupe_claims(claims)
+        if len(unique_claims) < len(claims):
+            log.debug("[CLAIMS] Verifying %d unique claim(s) after de-duplication.", len(unique_claims))
+        unique_results = await self.check_all_claims(unique_claims)
+        return self._decide(claims, slots, unique_results)
+
+    async def prepare_batch_request(self) -> Optional[Dict[str, Any]]:
+        """
+        Run the pipeline up to the verification call and return that call as a
+        Gemini Batch API request body, or None if the caches already decide
+        every claim.
+
+        Pass the batch job's response text to :meth:`complete_batch_request`
+        to get the final decision.
+        """
+        log.debug("Analyzing backstory for %s...", self.character_name)
+        claims = await self.extract_backstory_claims()
+        log.debug("Found %d claims to verify.", len(claims))
+
+        unique_claims, slots = self._dedupe_claims(claims)
+        plan = await self._plan_verification(unique_claims)
+        self._batch_state = (claims, slots, plan)
+        if plan["prompt"] is None:
+            return None
+        return {
+            "contents": [{"role": "user", "parts": [{"text": plan["prompt"]}]}],
+            "generation_config": {
+                "temperature": 0.2,
+                "response_mime_type": "application/json",
+                "response_schema": _rest_schema(_VERDICT_LIST_SCHEMA),
+            },
+            "safety_settings": [dict(setting) for setting in SAFETY_SETTINGS],
+        }
+
+    async def complete_batch_request(self, raw: Optional[str]) -> Dict[str, Any]:
+        """
+        Finish a decision started by :meth:`prepare_batch_request`.
+
+        ``raw`` is the model text for this checker's request, or None if the
+        batch job returned nothing for it; claims are then checked individually.
+        """
+        if self._batch_state is None:
+            raise RuntimeError("prepare_batch_request() must be called first.")
+        claims, slots, plan = self._batch_state
+        self._batch_state = None
+        unique_results = await self._finish_verification(plan, raw)
+        return self._decide(claims, slots, unique_results)
+
+    def _decide(
+        self, claims: List[str], slots: List[int], unique_results: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Expand de-duplicated results back to ``claims`` and apply the decision rule."""
+        results = [dict(unique_results[slot], claim=claim) for claim, slot in zip(claims, slots)]
+
+        # Single pass: count high-confidence contradictions and track the strongest one.
+        high_conf_contradictions = 0
+        strongest_contradiction: Optional[Dict[str, Any]] = None
+        for r in results:
+            if r.get("consistency") != "contradict":
+                continue
+            confidence = r.get("confidence", 0)
+            if confidence > CONTRADICTION_CONFIDENCE:
+                high_conf_contradictions += 1
+            if strongest_contradiction is None or confidence > strongest_contradiction.get("confidence", 0):
+                strongest_contradiction = r
+        final_label = "contradict" if high_conf_contradictions >= MIN_CONTRADICTIONS else "consistent"
+        rationale = self.generate_rationale(results, final_label, strongest_contradiction)
 
         return {
             "prediction": final_label,
@@ -283,16 +954,20 @@ Return JSON with:
             "book": self.book_name,
         }
 
-    def generate_rationale(self, claim_results: List[Dict[str, Any]], final_decision: str) -> str:
+    def generate_rationale(
+        self,
+        claim_results: List[Dict[str, Any]],
+        final_decision: str,
+        strongest_contradiction: Optional[Dict[str, Any]] = None,
+    ) -> str:
         """
         Build a concise rationale based on claim results.
+
+        ``strongest_contradiction`` is the highest-confidence contradicting
+        result, as found by make_final_decision.
         """
         if final_decision == "contradict":
-            strongest = max(
-                claim_results,
-                key=lambda r: r.get("confidence", 0) if r.get("consistency") == "contradict" else -1,
-                default=None,
-            )
+            strongest = strongest_contradiction
             if strongest:
                 return (
                     f"Found multiple high-confidence contradictions; strongest evidence: "
@@ -310,25 +985,22 @@ Return JSON with:
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     try:
         # Minimal smoke test using the first available book
-        from pathlib import Path
-
         books_dir = Path(__file__).resolve().parent.parent / "books"
         book_files = sorted(books_dir.glob("*.txt"))
         if not book_files:
             raise FileNotFoundError("No books found for testing.")
         sample_path = book_files[0]
-        sample_text = sample_path.read_text(encoding="utf-8")
         sample_backstory = (
             "The character grew up near the coast, learned navigation early, "
             "lost a sibling in a storm, and now avoids sea voyages."
         )
 
-        checker = ConsistencyChecker(
-            novel_text=sample_text,
+        checker = ConsistencyChecker.from_path(
+            sample_path,
             backstory_content=sample_backstory,
-            book_name=sample_path.stem,
             character_name="Sample Character",
         )
         result = checker.make_final_decision()
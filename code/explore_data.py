@@ -1,3 +1,4 @@
+import atexit
 import pandas as pd
 import os
 from pathlib import Path
@@ -12,14 +13,15 @@ SUMMARY_FILE = os.path.join(RESULTS_DIR, 'dataset_summary.txt')
 # Create results directory if it doesn't exist
 os.makedirs(RESULTS_DIR, exist_ok=True)
 
-# Initialize summary content
-summary_lines = []
+# Open the summary file once and write each line through as it is printed
+summary_file = open(SUMMARY_FILE, 'w', encoding='utf-8', buffering=1)
+atexit.register(summary_file.close)
 
 def print_and_save(text, emoji=''):
     """Print to console and save to summary file"""
     output = f"{emoji} {text}" if emoji else text
     print(output)
-    summary_lines.append(output)
+    summary_file.write(output + '\n')
 
 print_and_save("=" * 80)
 print_and_save("📊 DATASET EXPLORATION REPORT", "📊")
@@ -33,15 +35,27 @@ print_and_save("=" * 80)
 print_and_save("1️⃣  LOADING DATASETS", "1️⃣")
 print_and_save("=" * 80)
 
+def load_csv(path):
+    """Read a CSV with the multithreaded pyarrow parser, falling back to the default engine"""
+    try:
+        df = pd.read_csv(path, engine='pyarrow', dtype_backend='pyarrow')
+    except (ImportError, ValueError):
+        df = pd.read_csv(path)
+    # Low-cardinality label columns compare and count on integer codes as categories
+    for col in ('book_name', 'char', 'label'):
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
 try:
-    train_df = pd.read_csv(TRAIN_CSV)
+    train_df = load_csv(TRAIN_CSV)
     print_and_save(f"✅ Successfully loaded train.csv")
 except Exception as e:
     print_and_save(f"❌ Error loading train.csv: {e}")
     train_df = None
 
 try:
-    test_df = pd.read_csv(TEST_CSV)
+    test_df = load_csv(TEST_CSV)
     print_and_save(f"✅ Successfully loaded test.csv")
 except Exception as e:
     print_and_save(f"❌ Error loading test.csv: {e}")
@@ -86,9 +100,7 @@ if train_df is not None:
     
     print_and_save("First 5 rows:")
     print_and_save("-" * 80)
-    df_head_str = train_df.head().to_string()
-    print(df_head_str)
-    summary_lines.append(df_head_str)
+    print_and_save(train_df.head().to_string())
     print_and_save("")
 
 if test_df is not None:
@@ -121,9 +133,7 @@ if test_df is not None:
     
     print_and_save("First 5 rows:")
     print_and_save("-" * 80)
-    df_head_str = test_df.head().to_string()
-    print(df_head_str)
-    summary_lines.append(df_head_str)
+    print_and_save(test_df.head().to_string())
     print_and_save("")
 
 # ============================================================================
@@ -135,14 +145,15 @@ print_and_save("=" * 80)
 
 books_info = []
 if os.path.exists(BOOKS_DIR):
-    book_files = [f for f in os.listdir(BOOKS_DIR) if f.endswith('.txt')]
-    book_files.sort()
+    # scandir yields entries with cached stat info, so no extra stat per file
+    with os.scandir(BOOKS_DIR) as it:
+        book_entries = sorted((e for e in it if e.name.endswith('.txt')), key=lambda e: e.name)
     
-    print_and_save(f"\nFound {len(book_files)} book file(s):\n")
+    print_and_save(f"\nFound {len(book_entries)} book file(s):\n")
     
-    for book_file in book_files:
-        file_path = os.path.join(BOOKS_DIR, book_file)
-        file_size = os.path.getsize(file_path)
+    for entry in book_entries:
+        book_file = entry.name
+        file_size = entry.stat().st_size
         file_size_mb = file_size / (1024 * 1024)
         file_size_kb = file_size / 1024
         
@@ -179,15 +190,21 @@ if train_df is not None and test_df is not None:
     
     all_books = train_books.union(test_books)
     
+    # Count rows per book once instead of filtering the DataFrame per book
+    train_counts = train_df['book_name'].value_counts().to_dict() if 'book_name' in train_df.columns else {}
+    test_counts = test_df['book_name'].value_counts().to_dict() if 'book_name' in test_df.columns else {}
+    
     print_and_save("Book distribution:")
     print_and_save("-" * 80)
     
     for book in sorted(all_books):
-        in_train = "✅" if book in train_books else "❌"
-        in_test = "✅" if book in test_books else "❌"
+        is_in_train = book in train_books
+        is_in_test = book in test_books
+        in_train = "✅" if is_in_train else "❌"
+        in_test = "✅" if is_in_test else "❌"
         
-        train_count = len(train_df[train_df['book_name'] == book]) if book in train_books else 0
-        test_count = len(test_df[test_df['book_name'] == book]) if book in test_books else 0
+        train_count = train_counts.get(book, 0) if is_in_train else 0
+        test_count = test_counts.get(book, 0) if is_in_test else 0
         
         print_and_save(f"  📖 {book}")
         print_and_save(f"     Train: {in_train} ({train_count:,} rows)")
@@ -269,11 +286,10 @@ print_and_save("6️⃣  SAVING SUMMARY", "6️⃣")
 print_and_save("=" * 80)
 
 try:
-    with open(SUMMARY_FILE, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(summary_lines))
+    summary_file.flush()
     print_and_save(f"\n✅ Summary saved to: {SUMMARY_FILE}")
 except Exception as e:
-    print_and_save(f"\n❌ Error saving summary: {e}")
+    print(f"\n❌ Error saving summary: {e}")
 
 print_and_save("")
 print_and_save("=" * 80)
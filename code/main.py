@@ -7,18 +7,40 @@ This script:
 - Saves a submission file to results/submission.csv.
 """
 
+import asyncio
+import csv
+import functools
 import json
+import logging
+import mmap
+import multiprocessing
 import os
 import sys
+import threading
 import time
-from typing import Dict, Any
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
 import pandas as pd
 from dotenv import load_dotenv
 from tqdm import tqdm
 import google.generativeai as genai
 
-from consistency_checker import ConsistencyChecker
+from consistency_checker import MODEL_NAME, ConsistencyChecker
+from rate_limit import MAX_CONCURRENCY_PER_MODEL, REQUESTS_PER_MINUTE, get_rate_limiter
+from retriever import EMBEDDING_MODEL, EMBEDDING_REQUESTS_PER_MINUTE, NovelRetriever
+
+try:
+    from google import genai as genai_client
+except ImportError:  # google-genai is optional; without it test.csv runs case by case
+    genai_client = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # pyarrow is optional; test.csv is then streamed in pandas chunks
+    pa_csv = None
 
 # ---------------------------------------------------------------------------
 # Setup
@@ -26,96 +48,197 @@ from consistency_checker import ConsistencyChecker
 
 load_dotenv()
 
+log = logging.getLogger(__name__)
+
 if os.environ.get("GEMINI_API_KEY"):
     genai.configure(api_key=os.environ["GEMINI_API_KEY"])
 
+# Repository layout, resolved from this file so the working directory does not matter.
+BASE_DIR = Path(__file__).resolve().parent.parent
+BOOKS_DIR = BASE_DIR / "books"
+RESULTS_DIR = BASE_DIR / "results"
+
 
 # ---------------------------------------------------------------------------
-# Book loading with simple caching
+# Book loading with bounded caching
 # ---------------------------------------------------------------------------
 
-_BOOK_CACHE: Dict[str, str] = {}
+# Most books kept mapped at once; older ones are unmapped when evicted.
+BOOK_CACHE_SIZE = 8
+
+
+def _map_file(path: Path) -> mmap.mmap:
+    """Map ``path`` read-only; the mapping stays valid after the file is closed."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"Book file is empty: {path}")
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
 
+@functools.lru_cache(maxsize=1)
+def _book_index() -> Dict[str, Path]:
+    """Map lower-cased stems of the .txt files in BOOKS_DIR to their paths (one listing per run)."""
+    if not BOOKS_DIR.is_dir():
+        raise FileNotFoundError(f"Books directory not found at: {BOOKS_DIR}")
+    return {path.stem.lower(): path for path in sorted(BOOKS_DIR.glob("*.txt"))}
 
-def load_book(book_name: str) -> str:
+
+@functools.lru_cache(maxsize=BOOK_CACHE_SIZE)
+def load_book(book_name: str) -> mmap.mmap:
     """
     Load book text from books/ folder.
 
-    - Tries exact match with .txt extension.
-    - Handles case variations (e.g. 'In Search of the Castaways' vs 'In search of the castaways').
+    - Matches the .txt file stem case-insensitively
+      (e.g. 'In Search of the Castaways' vs 'In search of the castaways').
     - Looks only in the top-level 'books' directory.
-    - Returns the full text or raises FileNotFoundError with a helpful message.
+    - Returns a read-only mmap of the UTF-8 file or raises FileNotFoundError
+      with a helpful message. Pages are read on demand and shared with the OS
+      page cache instead of being copied into a Python string.
+    - Results are LRU-cached by name, so at most BOOK_CACHE_SIZE books stay mapped.
     """
     if not book_name or not book_name.strip():
         raise ValueError("book_name is empty.")
 
-    # Use module location to be robust to current working directory.
-    base_dir = os.path.dirname(os.path.dirname(__file__))
-    books_dir = os.path.join(base_dir, "books")
+    target_lower = book_name.strip().lower()
+    path = _book_index().get(target_lower)
+    if path is None:
+        # The directory may have changed since it was listed; look once more.
+        _book_index.cache_clear()
+        path = _book_index().get(target_lower)
+    if path is None:
+        available = ", ".join(p.stem for p in _book_index().values()) or "No .txt files found"
+        raise FileNotFoundError(
+            f"Could not find book '{book_name}' in {BOOKS_DIR}. "
+            f"Available book names (stems): {available}"
+        )
 
-    if not os.path.isdir(books_dir):
-        raise FileNotFoundError(f"Books directory not found at: {books_dir}")
+    log.debug("[INFO] Loading book text for '%s'...", book_name)
+    return _map_file(path)
 
-    # Cache by original name
-    if book_name in _BOOK_CACHE:
-        return _BOOK_CACHE[book_name]
 
-    target_stem = book_name.strip()
-    target_lower = target_stem.lower()
+# One retriever per book, shared by every case (and thread) that uses the book.
+_RETRIEVERS: Dict[str, NovelRetriever] = {}
+_RETRIEVER_LOCKS: Dict[str, threading.Lock] = {}
+_RETRIEVERS_GUARD = threading.Lock()
 
-    # First, try exact filename: "<book_name>.txt"
-    exact_path = os.path.join(books_dir, f"{target_stem}.txt")
-    if os.path.isfile(exact_path):
-        with open(exact_path, "r", encoding="utf-8") as f:
-            text = f.read()
-        _BOOK_CACHE[book_name] = text
-        return text
 
-    # Otherwise, search case-insensitively over available .txt files
-    candidates = []
-    for fname in os.listdir(books_dir):
-        if not fname.lower().endswith(".txt"):
-            continue
-        stem = os.path.splitext(fname)[0]
-        candidates.append(stem)
-        if stem.lower() == target_lower:
-            path = os.path.join(books_dir, fname)
-            with open(path, "r", encoding="utf-8") as f:
-                text = f.read()
-            _BOOK_CACHE[book_name] = text
-            return text
-
-    available = ", ".join(sorted(candidates)) if candidates else "No .txt files found"
-    raise FileNotFoundError(
-        f"Could not find book '{book_name}' in {books_dir}. "
-        f"Available book names (stems): {available}"
+def get_retriever(book_name: str) -> NovelRetriever:
+    """
+    Return the shared retriever for ``book_name``, building it on first use.
+    Concurrent callers for the same book wait for a single build; different
+    books build in parallel. Failures are not cached, so every case of a
+    missing book reports the error.
+    """
+    with _RETRIEVERS_GUARD:
+        retriever = _RETRIEVERS.get(book_name)
+        if retriever is not None:
+            return retriever
+        lock = _RETRIEVER_LOCKS.setdefault(book_name, threading.Lock())
+    with lock:
+        retriever = _RETRIEVERS.get(book_name)
+        if retriever is None:
+            retriever = NovelRetriever(load_book(book_name), book_name)
+            with _RETRIEVERS_GUARD:
+                _RETRIEVERS[book_name] = retriever
+        return retriever
+
+
+def _make_checker(book_name: str, character: str, backstory: str) -> ConsistencyChecker:
+    return ConsistencyChecker(
+        novel_text=None,
+        backstory_content=backstory,
+        book_name=book_name,
+        character_name=character,
+        retriever=get_retriever(book_name),
     )
 
 
+# ---------------------------------------------------------------------------
+# CSV input
+# ---------------------------------------------------------------------------
+
+# Explicit dtypes skip per-call type inference; columns absent from a file are ignored.
+CSV_DTYPES = {
+    "id": "int64",
+    "book_name": "string",
+    "char": "string",
+    "caption": "string",
+    "content": "string",
+    "label": "string",
+}
+
+# Columns that make up a case, in the order of the Case tuple.
+CASE_COLUMNS = ["id", "book_name", "char", "content"]
+
+# (case_id, book_name, character, backstory)
+Case = Tuple[int, str, str, str]
+
+
+def read_cases_csv(path: Union[str, Path]) -> pd.DataFrame:
+    """Read train.csv/test.csv with the C parser and CSV_DTYPES."""
+    return pd.read_csv(path, dtype=CSV_DTYPES, engine="c")
+
+
+def iter_cases(df: pd.DataFrame, extra_columns: Optional[List[str]] = None) -> Iterator[tuple]:
+    """Yield plain tuples of CASE_COLUMNS (+ ``extra_columns``) without building a Series per row."""
+    return df[CASE_COLUMNS + (extra_columns or [])].itertuples(index=False, name=None)
+
+
+# Rows per chunk when streaming a CSV through pandas (pyarrow picks its own block size).
+CSV_CHUNK_ROWS = 1024
+
+
+def stream_cases_csv(path: Union[str, Path]) -> Iterator[Case]:
+    """
+    Yield cases from a CSV batch by batch, so processing can start before the
+    whole file is parsed and the full DataFrame is never held in memory.
+    """
+    if pa_csv is not None:
+        reader = pa_csv.open_csv(
+            str(path),
+            convert_options=pa_csv.ConvertOptions(
+                column_types={"id": pa.int64(), **{name: pa.string() for name in CASE_COLUMNS[1:]}},
+                include_columns=CASE_COLUMNS,
+            ),
+        )
+        for batch in reader:
+            columns = batch.to_pydict()
+            yield from zip(*(columns[name] for name in CASE_COLUMNS))
+        return
+
+    for chunk in pd.read_csv(path, dtype=CSV_DTYPES, engine="c", chunksize=CSV_CHUNK_ROWS):
+        yield from iter_cases(chunk)
+
+
 # ---------------------------------------------------------------------------
 # Single-case processing
 # ---------------------------------------------------------------------------
 
-def process_single_case(row: pd.Series, books_cache: Dict[str, str]) -> Dict[str, Any]:
-    """Process one test or train case into a prediction result."""
+def _error_result(case_id: Any, book_name: str, character: str, exc: Exception) -> Dict[str, Any]:
+    log.error("❌ Error processing case %s: %s", case_id, exc)
+    # Default to "consistent" on errors to avoid over-flagging contradictions.
+    return {
+        "id": case_id,
+        "prediction": "consistent",
+        "rationale": f"Error: {str(exc)[:100]}",
+        "book": book_name,
+        "character": character,
+    }
+
+
+def process_single_case(
+    case_id: int,
+    book_name: str,
+    character: str,
+    backstory: str,
+) -> Dict[str, Any]:
+    """
+    Process one test or train case into a prediction result.
+
+    The book's retriever comes from the shared registry (:func:`get_retriever`).
+    """
     try:
-        case_id = row["id"]
-        book_name = row["book_name"]
-        character = row["char"]
-        backstory = row["content"]
-
-        # Load and cache book text
-        if book_name not in books_cache:
-            print(f"\n[INFO] Loading book text for '{book_name}'...")
-            books_cache[book_name] = load_book(book_name)
-        novel_text = books_cache[book_name]
-
-        checker = ConsistencyChecker(
-            novel_text=novel_text,
-            backstory_content=backstory,
-            book_name=book_name,
-            character_name=character,
-        )
+        checker = _make_checker(book_name, character, backstory)
 
         result = checker.make_final_decision()
 
@@ -127,16 +250,127 @@ def process_single_case(row: pd.Series, books_cache: Dict[str, str]) -> Dict[str
             "character": character,
         }
     except Exception as e:  # noqa: BLE001
-        print(f"❌ Error processing case {row.get('id', '<unknown>')}: {e}")
-        # Default to "consistent" on errors to avoid over-flagging contradictions.
-        return {
-            "id": row.get("id", None),
-            "prediction": "consistent",
-            "rationale": f"Error: {str(e)[:100]}",
-            "book": row.get("book_name", ""),
-            "character": row.get("char", ""),
+        return _error_result(case_id, book_name, character, e)
+
+
+# ---------------------------------------------------------------------------
+# Gemini Batch API
+# ---------------------------------------------------------------------------
+
+# Seconds between batch job status polls.
+BATCH_POLL_SECONDS = 30
+
+_BATCH_DONE_STATES = {
+    "JOB_STATE_SUCCEEDED",
+    "JOB_STATE_FAILED",
+    "JOB_STATE_CANCELLED",
+    "JOB_STATE_EXPIRED",
+}
+
+
+def _response_text(response: Dict[str, Any]) -> Optional[str]:
+    """Concatenate the text parts of the first candidate of a REST response."""
+    candidates = response.get("candidates") or []
+    if not candidates:
+        return None
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    text = "".join(part.get("text", "") for part in parts)
+    return text or None
+
+
+def run_batch_job(requests: Dict[str, Dict[str, Any]], requests_path: Union[str, Path]) -> Dict[str, str]:
+    """
+    Submit ``requests`` (request body by key) as one Gemini batch job and wait for it.
+
+    The requests are written to ``requests_path`` as JSONL and uploaded. Returns
+    the response text by key; keys whose request failed are missing.
+    """
+    client = genai_client.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+
+    with open(requests_path, "w", encoding="utf-8") as f:
+        for key, request in requests.items():
+            f.write(json.dumps({"key": key, "request": request}, ensure_ascii=False) + "\n")
+
+    uploaded = client.files.upload(
+        file=requests_path,
+        config={"display_name": os.path.basename(requests_path), "mime_type": "jsonl"},
+    )
+    batch_job = client.batches.create(
+        model=f"models/{MODEL_NAME}",
+        src=uploaded.name,
+        config={"display_name": "backstory-consistency"},
+    )
+    log.info("[BATCH] Submitted %d request(s) as %s", len(requests), batch_job.name)
+
+    while batch_job.state.name not in _BATCH_DONE_STATES:
+        time.sleep(BATCH_POLL_SECONDS)
+        batch_job = client.batches.get(name=batch_job.name)
+        log.info("[BATCH] %s: %s", batch_job.name, batch_job.state.name)
+
+    if batch_job.state.name != "JOB_STATE_SUCCEEDED":
+        log.warning("[BATCH][WARN] Batch job ended in %s: %s", batch_job.state.name, batch_job.error)
+        return {}
+
+    content = client.files.download(file=batch_job.dest.file_name)
+    responses: Dict[str, str] = {}
+    for line in content.decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        if "error" in item:
+            log.warning("[BATCH][WARN] Request %s failed: %s", item.get("key"), item["error"])
+            continue
+        text = _response_text(item.get("response") or {})
+        if text is not None:
+            responses[item["key"]] = text
+    return responses
+
+
+def process_cases_batched(cases: List[Case], requests_path: Union[str, Path]) -> List[Dict[str, Any]]:
+    """
+    Process every case with one Gemini batch job for claim verification.
+
+    Pass 1 extracts and retrieves evidence for each case and collects its
+    verification request; the batch job then runs them all server-side;
+    pass 2 joins the responses back to the cases by id and decides each label.
+    """
+    checkers: Dict[str, ConsistencyChecker] = {}
+    requests: Dict[str, Dict[str, Any]] = {}
+    results: Dict[str, Dict[str, Any]] = {}
+
+    for case_id, book_name, character, backstory in tqdm(cases, desc="Preparing"):
+        key = str(case_id)
+        try:
+            checker = _make_checker(book_name, character, backstory)
+            request = asyncio.run(checker.prepare_batch_request())
+        except Exception as e:  # noqa: BLE001
+            results[key] = _error_result(case_id, book_name, character, e)
+            continue
+        checkers[key] = checker
+        if request is not None:
+            requests[key] = request
+
+    responses = run_batch_job(requests, requests_path) if requests else {}
+
+    for case_id, book_name, character, _ in tqdm(cases, desc="Deciding"):
+        key = str(case_id)
+        if key in results:
+            continue
+        try:
+            result = asyncio.run(checkers[key].complete_batch_request(responses.get(key)))
+        except Exception as e:  # noqa: BLE001
+            results[key] = _error_result(case_id, book_name, character, e)
+            continue
+        results[key] = {
+            "id": case_id,
+            "prediction": result["prediction"],
+            "rationale": result["rationale"],
+            "book": book_name,
+            "character": character,
         }
 
+    return [results[str(case[0])] for case in cases]
+
 
 # ---------------------------------------------------------------------------
 # Validation on train.csv
@@ -148,17 +382,15 @@ def validate_on_train() -> float:
     print("🧪 VALIDATION ON TRAIN.CSV (First 5 samples)")
     print("=" * 80)
 
-    train_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "train.csv")
-    train_df = pd.read_csv(train_path)
+    train_path = BASE_DIR / "train.csv"
+    train_df = read_cases_csv(train_path)
     sample_df = train_df.head(5)
 
-    books_cache: Dict[str, str] = {}
     correct = 0
     total = 0
 
-    for _, row in sample_df.iterrows():
-        result = process_single_case(row, books_cache)
-        actual = row["label"]
+    for *case, actual in iter_cases(sample_df, ["label"]):
+        result = process_single_case(*case)
         predicted = result["prediction"]
 
         match = "✅" if predicted == actual else "❌"
@@ -177,31 +409,197 @@ def validate_on_train() -> float:
 # Full test.csv processing
 # ---------------------------------------------------------------------------
 
-def process_test_set() -> pd.DataFrame:
-    """Process the entire test.csv and write results/submission.csv."""
-    print("\n" + "=" * 80)
-    print("🚀 PROCESSING TEST.CSV")
-    print("=" * 80)
+# Worker threads for case-by-case processing of test.csv.
+MAX_WORKERS = 4
 
-    base_dir = os.path.dirname(os.path.dirname(__file__))
-    test_path = os.path.join(base_dir, "test.csv")
-    results_dir = os.path.join(base_dir, "results")
-    os.makedirs(results_dir, exist_ok=True)
 
-    test_df = pd.read_csv(test_path)
-    print(f"📋 Total test cases: {len(test_df)}")
+# Worker processes when process_test_set(use_processes=True). Each takes an
+# equal share of the per-model rate limits, so more processes than model
+# slots would only queue on the limiter.
+PROCESS_WORKERS = min(os.cpu_count() or 1, MAX_CONCURRENCY_PER_MODEL)
 
-    books_cache: Dict[str, str] = {}
-    results = []
 
-    for _, row in tqdm(test_df.iterrows(), total=len(test_df), desc="Processing"):
-        result = process_single_case(row, books_cache)
-        results.append(result)
-        time.sleep(0.5)  # Respect rate limits
+# Column order of results/submission.csv.
+SUBMISSION_FIELDS = ["id", "prediction", "rationale", "book", "character"]
 
-    submission_df = pd.DataFrame(results)
-    output_path = os.path.join(results_dir, "submission.csv")
-    submission_df.to_csv(output_path, index=False)
+
+def _write_csv_atomic(path: Path, rows: List[Dict[str, Any]]) -> None:
+    """Write ``rows`` to ``path`` via a temporary file, so readers never see half a file."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUBMISSION_FIELDS, lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(rows)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _load_partial_results(partial_path: Path) -> Dict[int, Dict[str, Any]]:
+    """
+    Return the finished results in ``partial_path`` by case id, and rewrite
+    the file with just those rows.
+
+    A crash can leave a torn last row; rows missing a field are dropped, and
+    so are error results, so those cases are retried.
+    """
+    if not partial_path.exists():
+        return {}
+    with open(partial_path, encoding="utf-8", newline="") as f:
+        rows = [
+            row
+            for row in csv.DictReader(f)
+            if None not in row and None not in row.values() and not row["rationale"].startswith("Error:")
+        ]
+    done: Dict[int, Dict[str, Any]] = {}
+    for row in rows:
+        row["id"] = int(row["id"])
+        done[row["id"]] = row
+    _write_csv_atomic(partial_path, list(done.values()))
+    return done
+
+
+def _append_results(writer: csv.DictWriter, out_file, rows: List[Dict[str, Any]]) -> None:
+    """Append ``rows`` and force them to disk, so a crash loses at most the case in flight."""
+    writer.writerows(rows)
+    out_file.flush()
+    os.fsync(out_file.fileno())
+
+
+def _init_process_worker(workers: int, log_level: int) -> None:
+    """
+    Set up a worker process: logging, the Gemini API key, and this process's
+    share of the rate limits (limiters are per process, so the pool as a
+    whole would otherwise exceed the quota ``workers`` times over).
+    """
+    logging.basicConfig(level=log_level, format="%(message)s")
+    if os.environ.get("GEMINI_API_KEY"):
+        genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+    get_rate_limiter(
+        MODEL_NAME,
+        max_concurrency=max(1, MAX_CONCURRENCY_PER_MODEL // workers),
+        rpm=max(1, REQUESTS_PER_MINUTE // workers),
+    )
+    get_rate_limiter(EMBEDDING_MODEL, rpm=max(1, EMBEDDING_REQUESTS_PER_MINUTE // workers))
+
+
+def _make_process_pool(test_path: Union[str, Path]) -> ProcessPoolExecutor:
+    """
+    Build the worker pool for :func:`process_cases_parallel`.
+
+    Every book in ``test_path`` is indexed here first, so the workers only
+    open the persisted Chroma collections instead of each embedding the
+    novel. Workers are spawned rather than forked: by now this process holds
+    Chroma and gRPC state that is not fork-safe. The books are still shared,
+    since each worker mmaps the same files and reads them from the page cache.
+    """
+    for book_name in sorted({case[1] for case in stream_cases_csv(test_path)}):
+        try:
+            get_retriever(book_name)
+        except Exception as exc:  # noqa: BLE001
+            log.warning("[WARN] Could not index '%s' before starting workers: %s", book_name, exc)
+    return ProcessPoolExecutor(
+        max_workers=PROCESS_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_process_worker,
+        initargs=(PROCESS_WORKERS, logging.getLogger().getEffectiveLevel()),
+    )
+
+
+def process_cases_parallel(
+    test_path: Union[str, Path],
+    writer: csv.DictWriter,
+    out_file,
+    done: Dict[int, Dict[str, Any]],
+    use_processes: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Stream cases from ``test_path`` into a worker pool and append each result
+    as soon as it and every earlier case are done, keeping test.csv order.
+    Cases already in ``done`` are not processed again.
+
+    Cases are I/O-bound on Gemini, so threads are the default. With
+    ``use_processes`` they run in a pool of PROCESS_WORKERS processes
+    instead, which also parallelizes the CPU-side work (chunking, prompt
+    building, JSON parsing) that the GIL serializes across threads.
+    """
+    futures = []
+    case_ids = []
+    executor: Executor = (
+        _make_process_pool(test_path) if use_processes else ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    )
+    with executor:
+        for case in stream_cases_csv(test_path):
+            case_ids.append(case[0])
+            if case[0] not in done:
+                futures.append(executor.submit(process_single_case, *case))
+        print(f"📋 Total test cases: {len(case_ids)} ({len(case_ids) - len(futures)} already done)")
+
+        written = 0
+        for _ in tqdm(as_completed(futures), total=len(futures), desc="Processing"):
+            finished = []
+            while written < len(futures) and futures[written].done():
+                finished.append(futures[written].result())
+                written += 1
+            if finished:
+                _append_results(writer, out_file, finished)
+    new_results = {result["id"]: result for result in (future.result() for future in futures)}
+    return [done.get(case_id) or new_results[case_id] for case_id in case_ids]
+
+
+def process_test_set(use_batch_api: bool = True, use_processes: bool = False) -> pd.DataFrame:
+    """
+    Process the entire test.csv and write results/submission.csv.
+
+    With ``use_batch_api`` (and google-genai installed) claim verification for
+    all cases goes through a single Gemini batch job; otherwise cases are
+    streamed through a worker pool (threads, or processes with
+    ``use_processes``; see :func:`process_cases_parallel`).
+
+    Results are appended to results/submission.partial.csv as they finish. A
+    rerun after a crash or Ctrl-C resumes from that file, skipping cases that
+    already have a result; once every case is done the file is atomically
+    moved to submission.csv.
+    """
+    print("\n" + "=" * 80)
+    print("🚀 PROCESSING TEST.CSV")
+    print("=" * 80)
+
+    test_path = BASE_DIR / "test.csv"
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    output_path = RESULTS_DIR / "submission.csv"
+    partial_path = RESULTS_DIR / "submission.partial.csv"
+
+    if use_batch_api and genai_client is None:
+        log.warning("[WARN] google-genai is not installed; processing cases one by one.")
+        use_batch_api = False
+
+    done = _load_partial_results(partial_path)
+    if done:
+        print(f"♻️  Resuming: {len(done)} case(s) already in {partial_path.name}")
+
+    with open(partial_path, "a", encoding="utf-8", newline="") as out_file:
+        writer = csv.DictWriter(out_file, fieldnames=SUBMISSION_FIELDS, lineterminator="\n")
+        if out_file.tell() == 0:
+            writer.writeheader()
+        if use_batch_api:
+            cases: List[Case] = list(stream_cases_csv(test_path))
+            todo = [case for case in cases if case[0] not in done]
+            print(f"📋 Total test cases: {len(cases)} ({len(cases) - len(todo)} already done)")
+            requests_path = RESULTS_DIR / "batch_requests.jsonl"
+            new_results = process_cases_batched(todo, requests_path) if todo else []
+            _append_results(writer, out_file, new_results)
+            by_id = {**done, **{result["id"]: result for result in new_results}}
+            results = [by_id[case[0]] for case in cases]
+        else:
+            results = process_cases_parallel(test_path, writer, out_file, done, use_processes)
+
+    if done:
+        # Resumed rows come first in the partial file; restore test.csv order.
+        _write_csv_atomic(partial_path, results)
+    os.replace(partial_path, output_path)
+
+    submission_df = pd.DataFrame(results, columns=SUBMISSION_FIELDS)
 
     print(f"\n✅ Results saved to: {output_path}")
     print(f"📊 Predictions: {len(submission_df)} cases")
@@ -216,6 +614,9 @@ def process_test_set() -> pd.DataFrame:
 # ---------------------------------------------------------------------------
 
 if __name__ == "__main__":
+    # Progress is shown by tqdm; raise to DEBUG for per-claim/per-query detail.
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
     print("=" * 80)
     print("🎯 KDSH 2026 - Character Backstory Consistency Checker")
     print("=" * 80)
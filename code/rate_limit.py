@@ -0,0 +1,191 @@
+"""
+Client-side rate limiting for Gemini calls, shared by every thread and event
+loop in the process.
+"""
+
+import asyncio
+import contextlib
+import random
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+# Defaults per model: requests in flight at once, and requests per minute.
+MAX_CONCURRENCY_PER_MODEL = 4
+REQUESTS_PER_MINUTE = 60
+
+# Backoff after a 429: the server's retry delay if it sent one, otherwise a
+# base delay doubled per attempt and capped; either way stretched by jitter.
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+BACKOFF_JITTER = 0.25
+
+# Retry delays as they appear in 429 error text from the Gemini SDKs.
+_RETRY_DELAY_RES = [
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)"),  # gRPC RetryInfo
+    re.compile(r"\"retryDelay\":\s*\"([\d.]+)s\""),         # REST RetryInfo
+    re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE),  # human-readable message
+]
+
+# How often a coroutine re-checks for a free concurrency slot.
+_POLL_SECONDS = 0.05
+
+
+class RateLimiter:
+    """
+    Gate for one model.
+
+    At most ``max_concurrency`` calls are in flight, and permits are handed
+    out no faster than one every 60/``rpm`` seconds. After a 429,
+    :meth:`backoff` pushes back a shared ``retry_not_before`` deadline, so
+    every thread waits it out together instead of retrying in a herd.
+
+    Use ``with limiter:`` around blocking calls, or ``async with
+    limiter.slot():`` from a coroutine.
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY_PER_MODEL, rpm: int = REQUESTS_PER_MINUTE):
+        if max_concurrency <= 0:
+            raise ValueError("max_concurrency must be positive.")
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._interval = 60.0 / rpm if rpm > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_permit = 0.0
+        self.retry_not_before = 0.0
+
+    def _reserve_permit(self) -> float:
+        """Reserve the next send time and return how long to wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_permit, self.retry_not_before)
+            self._next_permit = start + self._interval
+        return start - now
+
+    def acquire(self) -> None:
+        self._semaphore.acquire()
+        try:
+            delay = self._reserve_permit()
+            if delay > 0:
+                time.sleep(delay)
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+    def release(self) -> None:
+        self._semaphore.release()
+
+    def __enter__(self) -> "RateLimiter":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+    @contextlib.asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Async form of ``with limiter:`` that never blocks the event loop."""
+        # Polling keeps cancellation safe: a cancelled waiter never holds a slot.
+        while not self._semaphore.acquire(blocking=False):
+            await asyncio.sleep(_POLL_SECONDS)
+        try:
+            delay = self._reserve_permit()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield
+        finally:
+            self._semaphore.release()
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Delay all callers after a rate-limit error on ``attempt`` (1-based);
+        return the delay.
+
+        ``retry_after`` is the server-supplied delay (see
+        :func:`retry_delay_from_error`). It is only ever stretched by the
+        jitter, never shortened, so no caller retries before the server allows.
+        """
+        if retry_after is not None and retry_after > 0:
+            delay = retry_after * (1 + random.uniform(0, BACKOFF_JITTER))
+        else:
+            delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt - 1))
+            delay *= 1 + random.uniform(-BACKOFF_JITTER, BACKOFF_JITTER)
+        with self._lock:
+            self.retry_not_before = max(self.retry_not_before, time.monotonic() + delay)
+        return delay
+
+
+_LIMITERS: Dict[str, RateLimiter] = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def get_rate_limiter(
+    model_name: str, max_concurrency: int = MAX_CONCURRENCY_PER_MODEL, rpm: int = REQUESTS_PER_MINUTE
+) -> RateLimiter:
+    """
+    Return the process-wide limiter for ``model_name``, creating it once.
+    The limits only apply to the call that creates it.
+    """
+    with _LIMITERS_LOCK:
+        limiter = _LIMITERS.get(model_name)
+        if limiter is None:
+            limiter = _LIMITERS[model_name] = RateLimiter(max_concurrency, rpm)
+        return limiter
+
+
+def is_rate_limit_error(exc: BaseException) -> bool:
+    """True for HTTP 429 / RESOURCE_EXHAUSTED errors from the Gemini SDKs."""
+    if getattr(exc, "code", None) == 429:
+        return True
+    message = str(exc)
+    return "429" in message or "RESOURCE_EXHAUSTED" in message or "Resource has been exhausted" in message
+
+
+def _find_retry_delay(details: Any) -> Optional[float]:
+    """Search error details (protos, dicts or lists of them) for a RetryInfo delay."""
+    retry_delay = getattr(details, "retry_delay", None)
+    if retry_delay is not None and hasattr(retry_delay, "seconds"):
+        return retry_delay.seconds + retry_delay.nanos / 1e9
+    if isinstance(details, dict):
+        value = details.get("retryDelay")
+        if isinstance(value, str) and value.endswith("s"):
+            try:
+                return float(value[:-1])
+            except ValueError:
+                pass
+        details = list(details.values())
+    if isinstance(details, (list, tuple)):
+        for item in details:
+            delay = _find_retry_delay(item)
+            if delay is not None:
+                return delay
+    return None
+
+
+def retry_delay_from_error(exc: BaseException) -> Optional[float]:
+    """
+    Seconds the server asked us to wait before retrying, if the error says:
+    a Retry-After header, RetryInfo in the error details, or a delay in the
+    message text. None when no hint is present.
+    """
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        value = headers.get("Retry-After") or headers.get("retry-after")
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                pass  # HTTP-date form; fall through to the other hints
+
+    for attr in ("details", "response_json"):
+        delay = _find_retry_delay(getattr(exc, attr, None))
+        if delay is not None:
+            return delay
+
+    message = str(exc)
+    for pattern in _RETRY_DELAY_RES:
+        match = pattern.search(message)
+        if match:
+            return float(match.group(1))
+    return None
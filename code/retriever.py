@@ -3,111 +3,320 @@ Retriever utilities for querying long-form novel text using Google Gemini embedd
 and a local ChromaDB vector store.
 """
 
+import hashlib
+import logging
+import mmap
 import os
 import re
+import threading
 import time
 from pathlib import Path
-from typing import List, Tuple
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import chromadb
 import google.generativeai as genai
+import numpy as np
 from chromadb.api.types import Documents, Embeddings, Metadatas
 from tqdm import tqdm
 
+from cache import CACHE_DIR, SQLiteCache
+from rate_limit import get_rate_limiter, is_rate_limit_error, retry_delay_from_error
+
+log = logging.getLogger(__name__)
+
 # Configure Gemini from environment
 genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
 
+EMBEDDING_MODEL = "models/text-embedding-004"
+
+# Client-side limit for embedding calls; the embedding quota is far above the chat model's.
+EMBEDDING_REQUESTS_PER_MINUTE = 1500
+
+# Chunks sent per embed_content request while indexing (the API maximum is 100).
+EMBED_BATCH_SIZE = 100
+
+# Embedding responses, keyed by sha1 of (model, task type, content).
+EMBEDDING_CACHE_PATH = CACHE_DIR / "embeddings.sqlite"
+
+# Persistent Chroma store; collections are keyed by book name + content hash.
+CHROMA_DIR = CACHE_DIR / "chroma"
+
+# HNSW settings for every collection (Chroma's defaults are M=16 and ef=100
+# for both build and search). Novels are at most a few thousand chunks, so a
+# wider build beam is cheap and a narrower search beam is plenty for top_k=7.
+# Vectors are L2-normalized before they reach Chroma, so inner product ranks
+# like cosine and the reported distance is 1 - cosine similarity.
+HNSW_METADATA = {
+    "hnsw:space": "ip",
+    "hnsw:M": 16,
+    "hnsw:construction_ef": 200,
+    "hnsw:search_ef": 64,
+}
+
+# Bump when the index settings change so existing collections are rebuilt.
+INDEX_VERSION = 3
+
+# Runs of ASCII-whitespace-free bytes, i.e. the words str.split() would produce.
+_WORD_RE = re.compile(rb"\S+")
+
+# Characters Chroma rejects in collection names.
+_SANITIZE_RE = re.compile(r"[^a-zA-Z0-9_-]+")
+
+# Byte -> "is ASCII whitespace" lookup, the same set as \s in a bytes regex.
+_WHITESPACE_LUT = np.zeros(256, dtype=bool)
+_WHITESPACE_LUT[list(b" \t\n\r\f\v")] = True
+
+# Novel text, UTF-8 bytes (e.g. an mmap of the file), or a path to the .txt file.
+NovelSource = Union[str, bytes, mmap.mmap, os.PathLike]
+
+# One lock per collection name: retrievers for the same book share the
+# Chroma collection, so only the first one to get here embeds the novel.
+_COLLECTION_LOCKS: Dict[str, threading.Lock] = {}
+_COLLECTION_LOCKS_GUARD = threading.Lock()
+
+
+def _collection_lock(name: str) -> threading.Lock:
+    with _COLLECTION_LOCKS_GUARD:
+        return _COLLECTION_LOCKS.setdefault(name, threading.Lock())
+
+
+_EMBEDDING_STORE: Optional[SQLiteCache] = None
+_EMBEDDING_STORE_LOCK = threading.Lock()
+
+
+def _get_embedding_store() -> SQLiteCache:
+    global _EMBEDDING_STORE
+    with _EMBEDDING_STORE_LOCK:
+        if _EMBEDDING_STORE is None:
+            _EMBEDDING_STORE = SQLiteCache(EMBEDDING_CACHE_PATH)
+        return _EMBEDDING_STORE
+
+
+def _embedding_key(task_type: str, content: str) -> str:
+    return hashlib.sha1(f"{EMBEDDING_MODEL}|{task_type}|{content}".encode("utf-8")).hexdigest()
+
+
+def _normalize_rows(vectors: Any) -> np.ndarray:
+    """Scale each row to unit L2 norm as float32 (all-zero rows stay zero)."""
+    arr = np.array(vectors, dtype=np.float32, ndmin=2)
+    arr /= np.linalg.norm(arr, axis=1, keepdims=True).clip(1e-12)
+    return arr
+
+
+_CLIENT: Optional[chromadb.ClientAPI] = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def _get_client() -> chromadb.ClientAPI:
+    """Return the process-wide Chroma client (concurrent construction is not safe)."""
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            CHROMA_DIR.mkdir(parents=True, exist_ok=True)
+            _CLIENT = chromadb.PersistentClient(path=str(CHROMA_DIR))
+        return _CLIENT
+
 
 class NovelRetriever:
     """
     Retrieves relevant passages from a novel using Gemini embeddings + ChromaDB.
     """
 
-    def __init__(self, novel_text: str, book_name: str):
-        if not novel_text or not novel_text.strip():
-            raise ValueError("novel_text is empty; cannot index.")
+    def __init__(self, novel_text: NovelSource, book_name: str):
+        """
+        ``novel_text`` is the novel as a string, UTF-8 bytes or an mmap of the
+        file, or a path to the .txt file. Paths are memory-mapped; for bytes
+        and mmaps only the chunk ranges are decoded, so the whole novel never
+        has to exist as one Python string.
 
-        self.novel_text = novel_text
+        The index is persisted on disk, so a novel is only embedded the first
+        time it is seen; later retrievers for the same text reuse it.
+        """
         self.book_name = book_name.strip() if book_name else "unknown_book"
-        self.collection_name = self._sanitize_collection_name(self.book_name)
-
-        print(f"[INIT] Using collection name: {self.collection_name}")
 
-        self.client = chromadb.Client()
-        self.collection = self.client.get_or_create_collection(self.collection_name)
-
-        self.chunks: List[str] = self.chunk_novel(self.novel_text)
-        print(f"[INIT] Created {len(self.chunks)} chunk(s) from novel text.")
+        if isinstance(novel_text, (str, bytes, mmap.mmap)):
+            buffer = novel_text.encode("utf-8") if isinstance(novel_text, str) else novel_text
+            if _WORD_RE.search(buffer) is None:
+                raise ValueError("novel_text is empty; cannot index.")
+            self.content_hash = hashlib.sha256(buffer).hexdigest()
+            self.chunks: List[str] = self.chunk_novel(buffer)
+        else:
+            with open(novel_text, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    raise ValueError("novel_text is empty; cannot index.")
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    self.content_hash = hashlib.sha256(buffer).hexdigest()
+                    self.chunks = self.chunk_novel(buffer)
+        log.debug("[INIT] Created %d chunk(s) from novel text.", len(self.chunks))
+
+        # The content hash in the name means an edited novel gets a fresh index.
+        self.collection_name = (
+            f"{self._sanitize_collection_name(self.book_name)}_{self.content_hash[:12]}_v{INDEX_VERSION}"
+        )
+        log.debug("[INIT] Using collection name: %s", self.collection_name)
 
+        self.client = _get_client()
+        self.collection = self._open_collection()
         self.index_chunks()
 
+    def _open_collection(self) -> chromadb.Collection:
+        """
+        Open this novel's collection, creating it with HNSW_METADATA if needed.
+        Vectors always come from Gemini, so no Chroma embedding function is attached.
+        """
+        return self.client.get_or_create_collection(
+            self.collection_name, metadata=HNSW_METADATA, embedding_function=None
+        )
+
     @staticmethod
     def _sanitize_collection_name(name: str) -> str:
         """Sanitize collection name to be filesystem and Chroma safe."""
-        cleaned = re.sub(r"[^a-zA-Z0-9_-]+", "_", name.strip().lower())
+        cleaned = _SANITIZE_RE.sub("_", name.strip().lower())
         return cleaned or "novel_collection"
 
-    def chunk_novel(self, text: str, chunk_size: int = 3000, overlap: int = 500) -> List[str]:
+    def chunk_novel(self, text: Union[bytes, mmap.mmap], chunk_size: int = 3000, overlap: int = 500) -> List[str]:
         """
-        Split text into overlapping word-based chunks for better retrieval context.
+        Split UTF-8 text into overlapping word-based chunks for better retrieval context.
+
+        Word boundaries are found with vectorized NumPy ops on the raw bytes
+        and each chunk is decoded from its own byte range, keeping the
+        original whitespace.
         """
-        words = text.split()
-        if not words:
+        is_word = ~_WHITESPACE_LUT[np.frombuffer(text, dtype=np.uint8)]
+        # Word starts/ends are where the mask flips; pad so edge words are closed.
+        edges = np.flatnonzero(np.diff(is_word, prepend=False, append=False))
+        del is_word
+        starts, ends = edges[0::2], edges[1::2]
+        if not len(starts):
             raise ValueError("Text contains no words to chunk.")
 
-        chunks: List[str] = []
         step = max(1, chunk_size - overlap)
-        idx = 0
-        while idx < len(words):
-            chunk_words = words[idx : idx + chunk_size]
-            chunks.append(" ".join(chunk_words))
-            idx += step
-        return chunks
-
-    def _embed_with_retry(self, content: str, task_type: str, max_retries: int = 5) -> List[float]:
+        first_words = np.arange(0, len(starts), step)
+        last_words = np.minimum(first_words + chunk_size, len(starts)) - 1
+        return [
+            text[start:end].decode("utf-8", "ignore")
+            for start, end in zip(starts[first_words].tolist(), ends[last_words].tolist())
+        ]
+
+    def _embed_with_retry(
+        self, content: Union[str, List[str]], task_type: str, max_retries: int = 5
+    ) -> Union[List[float], List[List[float]]]:
+        """
+        Embed content, reusing vectors cached on disk by earlier calls or runs.
+
+        A list of strings returns one vector per item; only the items missing
+        from the cache are sent, in a single request. Vectors are stored as
+        float32, and cached and fresh results are returned the same way.
+        """
+        items = [content] if isinstance(content, str) else list(content)
+        store = _get_embedding_store()
+        keys = [_embedding_key(task_type, item) for item in items]
+        blobs: List[Optional[bytes]] = [store.get(key) for key in keys]
+        missing = [idx for idx, blob in enumerate(blobs) if blob is None]
+
+        if missing:
+            if isinstance(content, str):
+                fetched = [self._request_embedding(content, task_type, max_retries)]
+            else:
+                fetched = self._request_embedding([items[idx] for idx in missing], task_type, max_retries)
+            if len(fetched) != len(missing):
+                raise ValueError(f"Expected {len(missing)} embeddings, got {len(fetched)}.")
+            new_entries = []
+            for idx, vector in zip(missing, fetched):
+                blobs[idx] = np.asarray(vector, dtype=np.float32).tobytes()
+                new_entries.append((keys[idx], blobs[idx]))
+            store.put_many(new_entries)
+
+        vectors = [np.frombuffer(blob, dtype=np.float32).tolist() for blob in blobs]
+        return vectors[0] if isinstance(content, str) else vectors
+
+    def _request_embedding(
+        self, content: Union[str, List[str]], task_type: str, max_retries: int = 5
+    ) -> Union[List[float], List[List[float]]]:
         """
-        Embed content with retry logic to handle rate limits or transient failures.
+        Call the embedding API with retry logic to handle rate limits or transient failures.
+
+        A list of strings is embedded in one request and returns one vector per item.
         """
+        limiter = get_rate_limiter(EMBEDDING_MODEL, rpm=EMBEDDING_REQUESTS_PER_MINUTE)
         delay = 1.0
         for attempt in range(1, max_retries + 1):
             try:
-                response = genai.embed_content(
-                    model="models/text-embedding-004",
-                    content=content,
-                    task_type=task_type,
-                )
+                with limiter:
+                    response = genai.embed_content(
+                        model=EMBEDDING_MODEL,
+                        content=content,
+                        task_type=task_type,
+                    )
                 embedding = response.get("embedding") or response.get("embeddings") or response
                 if embedding is None:
                     raise ValueError("No embedding returned from Gemini API.")
                 return embedding
             except Exception as exc:  # noqa: BLE001
-                print(f"[RETRY] Attempt {attempt}/{max_retries} failed: {exc}")
+                log.warning("[RETRY] Attempt %d/%d failed: %s", attempt, max_retries, exc)
                 if attempt == max_retries:
                     raise
+                if is_rate_limit_error(exc):
+                    # The limiter holds every caller back until the shared deadline.
+                    limiter.backoff(attempt, retry_delay_from_error(exc))
+                    continue
                 time.sleep(delay)
                 delay *= 2
 
     def index_chunks(self) -> None:
-        """Generate embeddings for each chunk and store them in ChromaDB."""
+        """Generate embeddings for each chunk and store them in ChromaDB, unless already indexed."""
         if not self.chunks:
             raise ValueError("No chunks to index.")
 
-        documents: Documents = []
-        metadatas: Metadatas = []
-        ids: List[str] = []
-        embeddings: Embeddings = []
+        # Held while embedding so a concurrent retriever for this novel waits and reuses the result.
+        with _collection_lock(self.collection_name):
+            if self.collection.count() >= len(self.chunks):
+                log.debug("[INDEX] Reusing %d indexed chunk(s) from '%s'.", len(self.chunks), self.collection_name)
+                return
+            self._embed_and_store_chunks()
 
-        print("[INDEX] Embedding and indexing chunks...")
-        for position, chunk in enumerate(tqdm(self.chunks, desc="Indexing chunks")):
-            chunk_id = f"{self.collection_name}_{position}"
+    def _embed_and_store_chunks(self) -> None:
+        positions: List[int] = []
+        embeddings: Embeddings = []
+        log.info("[INDEX] Embedding and indexing chunks...")
+        for first in tqdm(
+            range(0, len(self.chunks), EMBED_BATCH_SIZE), desc="Indexing chunk batches"
+        ):
+            batch = self.chunks[first : first + EMBED_BATCH_SIZE]
             try:
-                embedding = self._embed_with_retry(
-                    content=chunk, task_type="retrieval_document"
+                batch_embeddings = self._embed_with_retry(
+                    content=batch, task_type="retrieval_document"
                 )
+                if len(batch_embeddings) != len(batch):
+                    raise ValueError(
+                        f"Expected {len(batch)} embeddings, got {len(batch_embeddings)}."
+                    )
             except Exception as exc:  # noqa: BLE001
-                print(f"[INDEX][WARN] Skipping chunk {position} due to embedding error: {exc}")
-                continue
+                # Retry the batch chunk by chunk so one bad chunk only skips itself.
+                log.warning("[INDEX][WARN] Batch at chunk %d failed (%s); embedding chunks individually.", first, exc)
+                batch_embeddings = []
+                for position, chunk in enumerate(batch, start=first):
+                    try:
+                        batch_embeddings.append(
+                            self._embed_with_retry(content=chunk, task_type="retrieval_document")
+                        )
+                    except Exception as chunk_exc:  # noqa: BLE001
+                        log.warning("[INDEX][WARN] Skipping chunk %d due to embedding error: %s", position, chunk_exc)
+                        batch_embeddings.append(None)
+            for position, embedding in enumerate(batch_embeddings, start=first):
+                if embedding is not None:
+                    positions.append(position)
+                    embeddings.append(embedding)
+
+        if not positions:
+            raise RuntimeError("Failed to index any chunks due to embedding errors.")
 
+        documents: Documents = []
+        metadatas: Metadatas = []
+        ids: List[str] = []
+        for position in positions:
+            chunk = self.chunks[position]
+            chunk_id = f"{self.collection_name}_{position}"
             documents.append(chunk)
             metadatas.append(
                 {
@@ -118,77 +327,80 @@ class NovelRetriever:
                 }
             )
             ids.append(chunk_id)
-            embeddings.append(embedding)
 
-        if not documents:
-            raise RuntimeError("Failed to index any chunks due to embedding errors.")
-
-        # Remove existing collection to avoid duplicates, then re-create
-        self.client.delete_collection(self.collection_name)
-        self.collection = self.client.create_collection(self.collection_name)
-
-        self.collection.add(
+        # Ids are deterministic, so re-indexing overwrites entries in place.
+        self.collection.upsert(
             documents=documents,
             metadatas=metadatas,
             ids=ids,
-            embeddings=embeddings,
+            embeddings=_normalize_rows(embeddings),
         )
-        print(f"[INDEX] Indexed {len(documents)} chunk(s) into collection '{self.collection_name}'.")
+        log.info("[INDEX] Indexed %d chunk(s) into collection '%s'.", len(documents), self.collection_name)
+
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a search query with the same model/task type used for retrieval."""
+        if not query or not query.strip():
+            raise ValueError("Query is empty.")
+        return self._embed_with_retry(content=query, task_type="retrieval_query")
 
     def retrieve_relevant_passages(
-        self, query: str, top_k: int = 7
+        self, query: str, top_k: int = 7, query_embedding: Optional[List[float]] = None
     ) -> List[Tuple[str, float, dict]]:
         """
         Retrieve the most relevant passages for a given query.
-        Returns a list of tuples: (passage_text, distance_score, metadata).
+        Returns a list of tuples: (passage_text, distance_score, metadata),
+        where the distance is 1 - cosine similarity (lower is closer) and the
+        metadata is ``{"position": chunk_index}``.
+
+        Pass ``query_embedding`` (from :meth:`embed_query`) to skip re-embedding.
         """
         if not query or not query.strip():
             raise ValueError("Query is empty.")
         if top_k <= 0:
             raise ValueError("top_k must be positive.")
 
-        print(f"[RETRIEVE] Querying for: {query}")
-        embedding = self._embed_with_retry(
-            content=query, task_type="retrieval_query"
-        )
+        log.debug("[RETRIEVE] Querying for: %s", query)
+        embedding = query_embedding if query_embedding is not None else self.embed_query(query)
 
+        # Callers only need the chunk position from the metadata, and that is
+        # encoded in the id (always returned), so stored metadatas are not fetched.
         results = self.collection.query(
-            query_embeddings=[embedding],
+            query_embeddings=_normalize_rows(embedding),
             n_results=top_k,
-            include=["documents", "distances", "metadatas"],
+            include=["documents", "distances"],
         )
 
         if not results or not results.get("documents"):
-            print("[RETRIEVE] No results found.")
+            log.debug("[RETRIEVE] No results found.")
             return []
 
         documents = results["documents"][0]
         distances = results.get("distances", [[]])[0]
-        metadatas = results.get("metadatas", [[]])[0]
+        ids = results["ids"][0]
 
         passages = []
-        for doc, dist, meta in zip(documents, distances, metadatas):
-            passages.append((doc, float(dist), meta))
-        print(f"[RETRIEVE] Retrieved {len(passages)} passage(s).")
+        for doc, dist, chunk_id in zip(documents, distances, ids):
+            passages.append((doc, float(dist), {"position": int(chunk_id.rsplit("_", 1)[1])}))
+        log.debug("[RETRIEVE] Retrieved %d passage(s).", len(passages))
         return passages
 
 
-def _load_sample_book() -> Tuple[str, str]:
-    """Load the first .txt book from the ../books directory for testing."""
+def _load_sample_book() -> Tuple[Path, str]:
+    """Locate the first .txt book in the ../books directory for testing."""
     books_dir = Path(__file__).resolve().parent.parent / "books"
     txt_files = sorted(books_dir.glob("*.txt"))
     if not txt_files:
         raise FileNotFoundError(f"No .txt files found in {books_dir}")
     sample_path = txt_files[0]
     print(f"[TEST] Loading sample book: {sample_path.name}")
-    text = sample_path.read_text(encoding="utf-8")
-    return text, sample_path.stem
+    return sample_path, sample_path.stem
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     try:
-        book_text, book_name = _load_sample_book()
-        retriever = NovelRetriever(book_text, book_name)
+        book_path, book_name = _load_sample_book()
+        retriever = NovelRetriever(book_path, book_name)
         sample_query = "Describe the main character's motivations."
         results = retriever.retrieve_relevant_passages(sample_query, top_k=3)
         for i, (passage, score, meta) in enumerate(results, start=1):
@@ -2,6 +2,7 @@
 Smoke test for ConsistencyChecker using a sample backstory.
 """
 
+import logging
 import os
 import sys
 from pathlib import Path
@@ -20,6 +21,7 @@ except Exception as exc:  # noqa: BLE001
 
 def main() -> None:
     load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
 
     api_key = os.environ.get("GEMINI_API_KEY")
     if not api_key:
@@ -32,12 +34,6 @@ def main() -> None:
         print(f"[ERROR] Book not found: {book_path}")
         return
 
-    try:
-        novel_text = book_path.read_text(encoding="utf-8")
-    except Exception as exc:  # noqa: BLE001
-        print(f"[ERROR] Failed to read book text: {exc}")
-        return
-
     backstory = (
         "Faria lived quietly on a small island from 1800 onward, drafting a vast work on "
         "human intelligence while sending chapters out by secret courier."
@@ -48,11 +44,11 @@ def main() -> None:
     print("=" * 80)
 
     try:
-        checker = ConsistencyChecker(
-            novel_text=novel_text,
+        checker = ConsistencyChecker.from_path(
+            book_path,
             backstory_content=backstory,
-            book_name="The Count of Monte Cristo",
             character_name="Faria",
+            book_name="The Count of Monte Cristo",
         )
         result = checker.make_final_decision()
     except Exception as exc:  # noqa: BLE001